@@ -1,8 +1,13 @@
 import os
 import logging
 import json
+import hashlib
+import operator
+import random
+import sqlite3
 from dotenv import load_dotenv
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -13,22 +18,15 @@ from telegram.ext import (
     JobQueue,
 )
 import openai
-import requests
-from threading import Thread
+import aiohttp
+from aiohttp import web
+import orjson
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 import time
 from datetime import datetime, timedelta
 import asyncio
-
-# Import the keep_alive function
-try:
-    from keep_alive import keep_alive
-except ImportError:
-    logging.error(
-        "Could not import keep_alive.py. Ensure it's in the same directory.")
-
-    def keep_alive():
-        print("keep_alive function not found. Skipping web server startup.")
-
+from typing import Final, NamedTuple
 
 # --- Load .env file ---
 load_dotenv()
@@ -36,11 +34,18 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
 ALPHA_VANTAGE_API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
-
-# --- Set API key ---
+# Public hostname for webhook mode (e.g. finbot.example.com); unset = long polling
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST")
+# Port for the webhook listener. When polling, the keep-alive server only
+# runs if PORT is set explicitly (as uptime-pinged hosts do)
+PORT = int(os.getenv("PORT", "8080"))
+KEEP_ALIVE_ENABLED = "PORT" in os.environ
+
+# --- OpenAI client ---
 if OPENAI_API_KEY:
-    openai.api_key = OPENAI_API_KEY
+    ai_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
 else:
+    ai_client = None
     logging.warning("OPENAI_API_KEY is not set. AI features will not work.")
 
 # --- Logging ---
@@ -49,97 +54,538 @@ logging.basicConfig(
     level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# --- Global storage for tracked stocks (for simplicity; for production, use a database) ---
-# Format: { 'chat_id': { 'symbol': { 'target_price': float, 'direction': 'above'/'below' } } }
+# --- Storage for tracked stocks ---
+# Alerts are persisted one row per (chat, symbol) in SQLite and mirrored in memory.
+# Format: { 'chat_id': { 'symbol': Alert(target_price, direction) } }
+ALERTS_DB_FILE = 'alerts.db'
+# Legacy JSON store, imported into the database on first start
 TRACKED_STOCKS_FILE = 'tracked_stocks.json'
 
+# Writes run on one dedicated worker thread (see run_db_write), so they never
+# interleave on the shared connection and commit in the order they were issued.
+alerts_db = sqlite3.connect(ALERTS_DB_FILE,
+                            isolation_level=None,
+                            check_same_thread=False)
+alerts_db_executor = ThreadPoolExecutor(max_workers=1,
+                                        thread_name_prefix="alerts-db")
+alerts_db.execute("PRAGMA journal_mode=WAL")
+# WAL stays consistent with NORMAL; commits just skip the extra fsync
+alerts_db.execute("PRAGMA synchronous=NORMAL")
+alerts_db.execute("CREATE TABLE IF NOT EXISTS alerts("
+                  "chat_id INTEGER, symbol TEXT, target_price REAL, "
+                  "direction TEXT, PRIMARY KEY(chat_id, symbol))")
+
+
+class Alert(NamedTuple):
+    """An active price alert; direction is 'above' or 'below'."""
+    target_price: float
+    direction: str
+
+
+def migrate_tracked_stocks_file():
+    """Imports alerts from the legacy JSON file into the database."""
+    if not os.path.exists(TRACKED_STOCKS_FILE):
+        return
+    try:
+        with open(TRACKED_STOCKS_FILE, 'rb') as f:
+            data = orjson.loads(f.read())
+    except (IOError, json.JSONDecodeError) as e:
+        logger.error(f"Error reading {TRACKED_STOCKS_FILE} for migration: {e}")
+        return
+    rows = [(int(chat_id), symbol, alert['target_price'], alert['direction'])
+            for chat_id, symbols_data in data.items()
+            for symbol, alert in symbols_data.items()]
+    with alerts_db:
+        alerts_db.execute("BEGIN")
+        alerts_db.executemany(
+            "INSERT OR REPLACE INTO alerts VALUES (?, ?, ?, ?)", rows)
+    # Keep the old file around, but never import it twice
+    os.replace(TRACKED_STOCKS_FILE, TRACKED_STOCKS_FILE + '.migrated')
+    logger.info(
+        f"Migrated {len(rows)} alerts from {TRACKED_STOCKS_FILE} to {ALERTS_DB_FILE}."
+    )
+
 
 def load_tracked_stocks():
-    """Loads tracked stocks from a JSON file."""
-    if os.path.exists(TRACKED_STOCKS_FILE):
-        try:
-            with open(TRACKED_STOCKS_FILE, 'r') as f:
-                return json.load(f)
-        except json.JSONDecodeError as e:
-            logger.error(
-                f"Error decoding {TRACKED_STOCKS_FILE}: {e}. Starting with empty tracked stocks."
-            )
-            return {}
-    return {}
+    """Loads tracked stocks from the alerts database."""
+    data = {}
+    try:
+        for chat_id, symbol, target_price, direction in alerts_db.execute(
+                "SELECT chat_id, symbol, target_price, direction FROM alerts"):
+            data.setdefault(str(chat_id), {})[symbol] = Alert(
+                target_price, direction)
+    except sqlite3.Error as e:
+        logger.error(
+            f"Error reading {ALERTS_DB_FILE}: {e}. Starting with empty tracked stocks."
+        )
+        return {}
+    return data
+
+
+def save_alert(chat_id, symbol, target_price, direction):
+    """Inserts or updates a single alert row."""
+    try:
+        alerts_db.execute("INSERT OR REPLACE INTO alerts VALUES (?, ?, ?, ?)",
+                          (int(chat_id), symbol, target_price, direction))
+    except sqlite3.Error as e:
+        logger.error(f"Error saving alert for {symbol} in chat {chat_id}: {e}")
+
+
+def delete_alert(chat_id, symbol):
+    """Deletes a single alert row."""
+    try:
+        alerts_db.execute(
+            "DELETE FROM alerts WHERE chat_id = ? AND symbol = ?",
+            (int(chat_id), symbol))
+    except sqlite3.Error as e:
+        logger.error(
+            f"Error deleting alert for {symbol} in chat {chat_id}: {e}")
 
 
-def save_tracked_stocks(data):
-    """Saves tracked stocks to a JSON file."""
+def delete_alerts(keys):
+    """Deletes many (chat_id, symbol) alert rows in one transaction."""
     try:
-        with open(TRACKED_STOCKS_FILE, 'w') as f:
-            json.dump(data, f, indent=4)
-    except IOError as e:
-        logger.error(f"Error saving {TRACKED_STOCKS_FILE}: {e}")
+        with alerts_db:
+            alerts_db.execute("BEGIN")
+            alerts_db.executemany(
+                "DELETE FROM alerts WHERE chat_id = ? AND symbol = ?",
+                [(int(chat_id), symbol) for chat_id, symbol in keys])
+    except sqlite3.Error as e:
+        logger.error(f"Error deleting {len(keys)} triggered alerts: {e}")
 
 
+async def run_db_write(func, *args):
+    """Runs a database write on the alerts writer thread.
+
+    The write is queued before the first suspension point, so awaiting this
+    right after the matching in-memory change keeps SQLite in the same order.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(alerts_db_executor, func, *args)
+
+
+migrate_tracked_stocks_file()
 tracked_stocks = load_tracked_stocks()
 logger.info(f"Loaded tracked stocks: {tracked_stocks}")
 
+# Symbol-major index over the same alert dicts, for the alert job
+# Format: { 'symbol': { 'chat_id': Alert(target_price, direction) } }
+tracked_stocks_by_symbol = {}
+for chat_id_str, symbols_data in tracked_stocks.items():
+    for symbol, alert_data in symbols_data.items():
+        tracked_stocks_by_symbol.setdefault(symbol, {})[chat_id_str] = alert_data
+
+
+def add_tracked_alert(chat_id, symbol, alert_data):
+    """Adds an alert to tracked_stocks and its by-symbol index."""
+    tracked_stocks.setdefault(chat_id, {})[symbol] = alert_data
+    tracked_stocks_by_symbol.setdefault(symbol, {})[chat_id] = alert_data
+
+
+def remove_tracked_alert(chat_id, symbol):
+    """Removes an alert from tracked_stocks and its by-symbol index.
+
+    Returns False if the chat wasn't tracking the symbol.
+    """
+    symbols_data = tracked_stocks.get(chat_id)
+    if not symbols_data or symbol not in symbols_data:
+        return False
+    del symbols_data[symbol]
+    if not symbols_data:  # If no more alerts for this chat, remove chat entry
+        del tracked_stocks[chat_id]
+    subscribers = tracked_stocks_by_symbol[symbol]
+    del subscribers[chat_id]
+    if not subscribers:
+        del tracked_stocks_by_symbol[symbol]
+    return True
+
+
+# --- API URL templates (API keys are filled in once, here) ---
+AV_QUERY_URL = f"https://www.alphavantage.co/query?function={{function}}&symbol={{symbol}}&apikey={ALPHA_VANTAGE_API_KEY}"
+AV_NEWS_SENTIMENT_URL = f"https://www.alphavantage.co/query?function=NEWS_SENTIMENT&tickers={{symbol}}&time_from={{time_from}}&sort=LATEST&limit=10&apikey={ALPHA_VANTAGE_API_KEY}"
+AV_BULK_QUOTES_URL = f"https://www.alphavantage.co/query?function=REALTIME_BULK_QUOTES&symbol={{symbols}}&apikey={ALPHA_VANTAGE_API_KEY}"
+NEWS_HEADLINES_URL = f"https://newsapi.org/v2/top-headlines?category=business&language=en&apiKey={NEWS_API_KEY}"
+
+
+# --- Outbound rate limiting ---
+class AsyncRateLimiter:
+    """Token bucket allowing at most `rate` calls per `period` seconds.
+
+    Use as `async with limiter:`; callers wait for a token instead of
+    spending a request on an API-limit response.
+    """
+
+    def __init__(self, rate, period=60.0):
+        self.rate = rate
+        self.period = period
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                self._check_can_proceed()
+                now = time.monotonic()
+                self._tokens = min(
+                    self.rate, self._tokens +
+                    (now - self._updated) * self.rate / self.period)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await self._wait((1 - self._tokens) * self.period / self.rate)
+
+    def _check_can_proceed(self):
+        """Hook for subclasses: raise to give up waiting before a token is taken."""
+
+    async def _wait(self, delay):
+        await asyncio.sleep(delay)
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+# Alpha Vantage's free tier allows 5 requests per minute
+ALPHA_VANTAGE_CALLS_PER_MINUTE = int(
+    os.getenv("ALPHA_VANTAGE_CALLS_PER_MINUTE", "5"))
+# User commands keep at least this many calls per minute, so /analyze's four
+# concurrent requests go out without waiting for a refill
+AV_MIN_COMMAND_CALLS_PER_MINUTE = 4
+# The rest of the budget is reserved for the price alert job, in its own
+# bucket, so user commands never queue behind a full alert cycle
+ALPHA_VANTAGE_ALERT_CALLS_PER_MINUTE = max(
+    1,
+    min(int(os.getenv("ALPHA_VANTAGE_ALERT_CALLS_PER_MINUTE", "1")),
+        ALPHA_VANTAGE_CALLS_PER_MINUTE - AV_MIN_COMMAND_CALLS_PER_MINUTE))
+av_rate_limiter = AsyncRateLimiter(
+    max(1, ALPHA_VANTAGE_CALLS_PER_MINUTE -
+        ALPHA_VANTAGE_ALERT_CALLS_PER_MINUTE))
+
+# --- Shared HTTP session (created once the bot's event loop is running) ---
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+
+async def keep_alive_handler(request: web.Request) -> web.Response:
+    """Answers uptime pings."""
+    return web.Response(text="FinBot is alive!")
+
+
+async def start_keep_alive(application: Application) -> None:
+    """Serves the keep-alive endpoint on the bot's own event loop."""
+    app = web.Application()
+    app.router.add_get("/", keep_alive_handler)
+    # Uptime pings arrive every few minutes; don't log each one
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, "0.0.0.0", PORT).start()
+    except OSError as e:
+        # The bot works fine without it; don't let a busy port stop startup
+        logger.error(
+            f"Could not start keep-alive server on port {PORT}: {e}. Continuing without it."
+        )
+        await runner.cleanup()
+        return
+    application.bot_data["keep_alive_runner"] = runner
+    logger.info(f"Keep-alive server listening on port {PORT}.")
+
+
+async def post_init(application: Application) -> None:
+    """Creates the aiohttp session shared by all handlers and starts keep-alive."""
+    application.bot_data["http_session"] = aiohttp.ClientSession(
+        timeout=HTTP_TIMEOUT)
+    logger.info("Shared HTTP session created.")
+    # In webhook mode Telegram's pushes keep the service awake
+    if not WEBHOOK_HOST and KEEP_ALIVE_ENABLED:
+        await start_keep_alive(application)
+
+
+async def post_shutdown(application: Application) -> None:
+    """Closes the shared aiohttp session and stops keep-alive."""
+    session = application.bot_data.pop("http_session", None)
+    if session is not None:
+        await session.close()
+        logger.info("Shared HTTP session closed.")
+    runner = application.bot_data.pop("keep_alive_runner", None)
+    if runner is not None:
+        await runner.cleanup()
+        logger.info("Keep-alive server stopped.")
+    # Let queued alert writes finish before the process exits
+    await asyncio.to_thread(alerts_db_executor.shutdown)
+
+
+async def fetch_json(context: ContextTypes.DEFAULT_TYPE,
+                     url,
+                     timeout=None,
+                     raise_for_status=False):
+    """Fetches a URL with the shared session and returns the decoded JSON body.
+
+    Without an explicit `timeout` the request gets HTTP_TIMEOUT; aiohttp treats
+    timeout=None as "no timeout" rather than the session default.
+    """
+    if timeout is None:
+        timeout = HTTP_TIMEOUT
+    session = context.bot_data["http_session"]
+    async with session.get(url, timeout=timeout) as response:
+        if raise_for_status:
+            response.raise_for_status()
+        # Parsed with orjson; Alpha Vantage does not always send an
+        # application/json content type anyway.
+        return orjson.loads(await response.read())
+
+
+# --- Response caches ---
+# Seconds to keep each Alpha Vantage function's response before re-fetching.
+# Quotes move quickly; company fundamentals only change with new filings.
+AV_CACHE_TTLS = {
+    "GLOBAL_QUOTE": 60,
+    "OVERVIEW": 24 * 60 * 60,
+    "INCOME_STATEMENT": 24 * 60 * 60,
+    "BALANCE_SHEET": 24 * 60 * 60,
+    "CASH_FLOW": 24 * 60 * 60,
+    # The sentiment feed doesn't churn per request
+    "NEWS_SENTIMENT": 15 * 60,
+}
+NEWS_CACHE_TTL = 5 * 60
+# Alert prices are reused for two job ticks; intraday quotes rarely move
+# enough in that time to matter for a threshold alert
+ALERT_PRICE_CACHE_TTL = 120
+
+# Format: { 'function': TTLCache({ ('function', 'symbol'): response }) }
+av_response_cache = {
+    function: TTLCache(maxsize=1024, ttl=ttl)
+    for function, ttl in AV_CACHE_TTLS.items()
+}
+news_headlines_cache = TTLCache(maxsize=1, ttl=NEWS_CACHE_TTL)
+# Format: { 'symbol': float } - last price seen by the alert job
+tracked_stocks_price_cache = TTLCache(maxsize=1024, ttl=ALERT_PRICE_CACHE_TTL)
+
+
+# Fields of the latest annual report that /analyze uses, per statement.
+# Everything else (older years, quarterly reports) is dropped after parsing.
+AV_REPORT_FIELDS = {
+    "INCOME_STATEMENT": ("fiscalDateEnding", "totalRevenue", "grossProfit",
+                         "operatingIncome", "netIncome", "ebitda"),
+    "BALANCE_SHEET": ("fiscalDateEnding", "totalAssets", "totalLiabilities",
+                      "totalShareholderEquity",
+                      "cashAndCashEquivalentsAtCarryingValue"),
+    "CASH_FLOW": ("fiscalDateEnding", "operatingCashflow",
+                  "cashflowFromInvesting", "cashflowFromFinancing"),
+}
+
+
+def _latest_annual_report(data, fields):
+    """Reduces a statement response to the wanted fields of its latest annual report."""
+    reports = data.get("annualReports")
+    if not reports:
+        return data  # Error payloads pass through untouched
+    latest = reports[0]
+    return {
+        "annualReports":
+        [{field: latest[field]
+          for field in fields if field in latest}]
+    }
+
+
+def _av_url(function, symbol):
+    """Builds the Alpha Vantage query URL for a function and symbol."""
+    if function == "NEWS_SENTIMENT":
+        # Get more articles for better analysis
+        time_from = (datetime.now() - timedelta(days=7)).strftime('%Y%m%dT%H%M')
+        return AV_NEWS_SENTIMENT_URL.format(symbol=symbol, time_from=time_from)
+    return AV_QUERY_URL.format(function=function, symbol=symbol)
+
+
+async def fetch_av(context: ContextTypes.DEFAULT_TYPE,
+                   function,
+                   symbol,
+                   timeout=None,
+                   raise_for_status=False,
+                   limiter=av_rate_limiter):
+    """Fetches an Alpha Vantage function for a symbol, serving repeats from cache.
+
+    Cache misses wait for a token from `limiter`; the alert job passes its own.
+    """
+    cache = av_response_cache[function]
+    key = (function, symbol)
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    # Only cache misses spend a request from the rate limit
+    async with limiter:
+        data = await fetch_json(context,
+                                _av_url(function, symbol),
+                                timeout=timeout,
+                                raise_for_status=raise_for_status)
+    report_fields = AV_REPORT_FIELDS.get(function)
+    if report_fields:
+        data = _latest_annual_report(data, report_fields)
+    # Never cache rate-limit notices or invalid-symbol errors
+    if "Error Message" not in data and "Information" not in data:
+        cache[key] = data
+    return data
+
+
+async def fetch_top_headlines(context: ContextTypes.DEFAULT_TYPE, timeout=None):
+    """Fetches the NewsAPI business headlines, serving repeats from cache."""
+    data = news_headlines_cache.get("top-headlines")
+    if data is not None:
+        return data
+
+    data = await fetch_json(context, NEWS_HEADLINES_URL, timeout=timeout)
+    if data.get("status") != "error":
+        news_headlines_cache["top-headlines"] = data
+    return data
+
 
 # --- Helper function for AI summarization/recommendation ---
-async def generate_ai_response(prompt_text, max_tokens=500):
-    """Generates a response using OpenAI's GPT model."""
-    if not OPENAI_API_KEY:
-        return "🤖 My AI brain is offline! The OpenAI API key is missing. Please contact the bot's administrator."
+# Identical prompts (e.g. /analyze on the same symbol) reuse the answer for 10 minutes
+# Format: { (prompt_digest, max_tokens): 'response text' }
+ai_response_cache = TTLCache(maxsize=2048, ttl=10 * 60)
+
+
+async def stream_ai_response(prompt_text, max_tokens=500):
+    """Streams a response from OpenAI's GPT model, yielding the text so far."""
+    if ai_client is None:
+        yield "🤖 My AI brain is offline! The OpenAI API key is missing. Please contact the bot's administrator."
+        return
+    cache_key = (hashlib.blake2b(prompt_text.encode(),
+                                 digest_size=16).digest(), max_tokens)
+    cached_response = ai_response_cache.get(cache_key)
+    if cached_response is not None:
+        yield cached_response
+        return
     try:
-        response = openai.ChatCompletion.create(model="gpt-3.5-turbo",
-                                                messages=[{
-                                                    "role":
-                                                    "user",
-                                                    "content":
-                                                    prompt_text
-                                                }],
-                                                temperature=0.7,
-                                                max_tokens=max_tokens)
-        return response["choices"][0]["message"]["content"]
-    except openai.error.AuthenticationError:
+        stream = await ai_client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[{
+                "role": "user",
+                "content": prompt_text
+            }],
+            temperature=0.7,
+            max_tokens=max_tokens,
+            stream=True)
+        content = ""
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                content += delta
+                yield content
+        if not content:
+            # Nothing to cache or to send; Telegram rejects empty messages
+            logger.warning("OpenAI returned an empty response.")
+            yield "🤖 I couldn't come up with an answer this time. Please try again in a moment."
+            return
+        ai_response_cache[cache_key] = content
+    except openai.AuthenticationError:
         logger.error("OpenAI API authentication failed. Check your API key.")
-        return "🤖 I'm having trouble connecting to my AI brain. It seems my OpenAI API key might be invalid. Please alert the bot's administrator!"
-    except openai.error.RateLimitError:
+        yield "🤖 I'm having trouble connecting to my AI brain. It seems my OpenAI API key might be invalid. Please alert the bot's administrator!"
+    except openai.RateLimitError:
         logger.warning("OpenAI API rate limit exceeded.")
-        return "🤖 Woah, slow down! I'm getting too many requests right now. Please try again in a moment."
-    except openai.error.OpenAIError as e:
+        yield "🤖 Woah, slow down! I'm getting too many requests right now. Please try again in a moment."
+    except openai.OpenAIError as e:
         logger.error(f"OpenAI API error: {e}")
-        return f"🤖 I'm having trouble connecting to my AI brain right now. Please try again later. (Error: {e})"
+        yield f"🤖 I'm having trouble connecting to my AI brain right now. Please try again later. (Error: {e})"
     except Exception as e:
         logger.error(f"Error generating AI response: {e}")
-        return "Oops! An unexpected error occurred while processing your AI request. My apologies!"
-
+        yield "Oops! An unexpected error occurred while processing your AI request. My apologies!"
+
+
+# Telegram allows roughly one message edit per second per chat
+STREAM_EDIT_INTERVAL = 1.0
+
+
+async def reply_with_ai_stream(message,
+                               prompt_text,
+                               max_tokens=500,
+                               header="",
+                               footer="",
+                               parse_mode=None):
+    """Replies with an AI response, editing the reply as the text streams in."""
+    reply = await message.reply_text(f"{header}⏳")
+    last_edit = time.monotonic()
+    content = ""
+    async for content in stream_ai_response(prompt_text, max_tokens):
+        now = time.monotonic()
+        if now - last_edit >= STREAM_EDIT_INTERVAL:
+            # Partial Markdown may be unbalanced, so progress edits are plain text
+            await reply.edit_text(f"{header}{content} ⏳")
+            last_edit = now
+    final_text = f"{header}{content}{footer}"
+    try:
+        await reply.edit_text(final_text, parse_mode=parse_mode)
+    except BadRequest as e:
+        if parse_mode is None:
+            raise
+        # The model's Markdown may not parse; show the answer unformatted
+        # rather than leaving the placeholder behind
+        logger.warning(f"Final AI reply edit failed ({e}); retrying as plain text.")
+        await reply.edit_text(final_text)
+    return reply
+
+
+# --- Reply templates (built once at import) ---
+START_TEXT: Final = (
+    "👋 Hello there! I'm your friendly *FinBot* 🤖 – your personal finance companion.\n\n"
+    "I'm here to make understanding the stock market easier and help you stay on top of your investments. "
+    "Here's what I can do for you:\n\n"
+    "📈 `/stock <symbol>` — Get live price, key details & *an easy-to-read summary* (e.g., `/stock AAPL`)\n"
+    "📊 `/analyze <symbol>` — Dive deeper! Get P/E, market cap, and *AI-powered financial insights* (e.g., `/analyze MSFT`)\n"
+    "🗞️ `/news` — Catch up on the *latest global finance headlines*.\n"
+    "🔍 `/stocknews <symbol>` — Get *company-specific news* (e.g., `/stocknews GOOG`)\n"
+    "❓ `/ask <question>` — Ask *any finance/investment question* and I'll explain it simply (e.g., `/ask What is inflation?`)\n"
+    "💡 `/recommend <symbol>` — Get an *AI-driven Buy/Sell/Hold outlook* based on recent news (Experimental)\n\n"
+    "🔔 *Price Alerts!* Never miss a beat:\n"
+    "👉 `/track <symbol> <price> <above/below>` — Set a price alert (e.g., `/track GOOG 180 above` or `/track AMZN 170 below`)\n"
+    "👉 `/myalerts` — See all your active price alerts.\n"
+    "👉 `/untrack <symbol>` — Stop tracking a stock.\n\n"
+    "✨ My goal is to simplify complex financial info just for YOU! Feel free to ask anything.\n\n"
+    "❗ *Important Disclaimer:* All information provided is for educational and informational purposes only and *does NOT constitute financial advice*. Always do your own research or consult a professional financial advisor before making any investment decisions. I'm just a bot here to help you understand better! 😊")
+
+STOCK_SUMMARY_TMPL: Final = (
+    "📈 *{name}* — Current Price\n\n"
+    "Current Price: {price:.2f} {currency}\n"
+    "Today's Change: {change:+.2f} ({change_percent:+.2f}%) {change_emoji}\n"
+    "Volume: {volume:,}\n\n"
+    "Want more details? Try `/analyze {symbol}` for deep insights! ✨")
+
+# Usage hints, sent when a command is missing its arguments
+STOCK_USAGE: Final = (
+    "❗Oops! Please tell me which stock you're interested in. Try: `/stock IBM`")
+ANALYZE_USAGE: Final = (
+    "❗To get a detailed financial analysis, please tell me the stock symbol. Example: `/analyze IBM`")
+STOCKNEWS_USAGE: Final = (
+    "❗To get news for a specific stock, please provide its symbol. Example: `/stocknews AAPL`")
+ASK_USAGE: Final = (
+    "❓ What's on your mind? Ask me anything about finance or investments! Example: `/ask What is the difference between stocks and bonds?`")
+RECOMMEND_USAGE: Final = (
+    "❗To get an AI-driven outlook, please provide a stock symbol. Example: `/recommend TSLA`")
+TRACK_USAGE: Final = (
+    "❗To set a price alert, please use the format: `/track <symbol> <price> <above/below>`\nExample: `/track GOOG 180 above` or `/track AMZN 170 below`")
+UNTRACK_USAGE: Final = (
+    "❗To stop tracking a stock, please use the format: `/untrack <symbol>`\nExample: `/untrack GOOG`")
+MY_ALERTS_HEADER: Final = "🔔 *Your Active Price Alerts:*\n\n"
+MY_ALERTS_FOOTER: Final = "\nTo remove an alert, use `/untrack <symbol>`."
+NO_ALERTS_TEXT: Final = (
+    "✨ You currently have no active price alerts. Set one with `/track <symbol> <price> <above/below>`!")
 
 # --- Telegram Bot Commands (defined before main) ---
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "👋 Hello there! I'm your friendly *FinBot* 🤖 – your personal finance companion.\n\n"
-        "I'm here to make understanding the stock market easier and help you stay on top of your investments. "
-        "Here's what I can do for you:\n\n"
-        "📈 `/stock <symbol>` — Get live price, key details & *an easy-to-read summary* (e.g., `/stock AAPL`)\n"
-        "📊 `/analyze <symbol>` — Dive deeper! Get P/E, market cap, and *AI-powered financial insights* (e.g., `/analyze MSFT`)\n"
-        "🗞️ `/news` — Catch up on the *latest global finance headlines*.\n"
-        "🔍 `/stocknews <symbol>` — Get *company-specific news* (e.g., `/stocknews GOOG`)\n"
-        "❓ `/ask <question>` — Ask *any finance/investment question* and I'll explain it simply (e.g., `/ask What is inflation?`)\n"
-        "💡 `/recommend <symbol>` — Get an *AI-driven Buy/Sell/Hold outlook* based on recent news (Experimental)\n\n"
-        "🔔 *Price Alerts!* Never miss a beat:\n"
-        "👉 `/track <symbol> <price> <above/below>` — Set a price alert (e.g., `/track GOOG 180 above` or `/track AMZN 170 below`)\n"
-        "👉 `/myalerts` — See all your active price alerts.\n"
-        "👉 `/untrack <symbol>` — Stop tracking a stock.\n\n"
-        "✨ My goal is to simplify complex financial info just for YOU! Feel free to ask anything.\n\n"
-        "❗ *Important Disclaimer:* All information provided is for educational and informational purposes only and *does NOT constitute financial advice*. Always do your own research or consult a professional financial advisor before making any investment decisions. I'm just a bot here to help you understand better! 😊",
-        parse_mode="Markdown")
+    await update.message.reply_text(START_TEXT, parse_mode="Markdown")
 
 
 async def stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
     symbol = " ".join(context.args).upper()
     if not symbol:
         await update.message.reply_text(
-            "❗Oops! Please tell me which stock you're interested in. Try: `/stock IBM`",
-            parse_mode="Markdown")
+            STOCK_USAGE, parse_mode="Markdown")
         return
 
     if not ALPHA_VANTAGE_API_KEY:
@@ -152,11 +598,11 @@ async def stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
                                     parse_mode="Markdown")
 
     try:
-        url = f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={ALPHA_VANTAGE_API_KEY}"
-        response = requests.get(url, timeout=10)
-        response.raise_for_status(
-        )  # Raise an exception for HTTP errors (4xx or 5xx)
-        data = response.json()
+        # Raises ClientResponseError for HTTP errors (4xx or 5xx)
+        data = await fetch_av(context,
+                              "GLOBAL_QUOTE",
+                              symbol,
+                              raise_for_status=True)
 
         global_quote = data.get("Global Quote", {})
 
@@ -172,13 +618,14 @@ async def stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             change_emoji = '🟢' if change > 0 else ('🔴' if change < 0 else '⚪')
 
-            summary = (
-                f"📈 *{name}* — Current Price\n\n"
-                f"Current Price: {price:.2f} {currency}\n"
-                f"Today's Change: {change:+.2f} ({change_percent:+.2f}%) {change_emoji}\n"
-                f"Volume: {volume:,}\n\n"
-                f"Want more details? Try `/analyze {symbol}` for deep insights! ✨"
-            )
+            summary = STOCK_SUMMARY_TMPL.format(name=name,
+                                                price=price,
+                                                currency=currency,
+                                                change=change,
+                                                change_percent=change_percent,
+                                                change_emoji=change_emoji,
+                                                volume=volume,
+                                                symbol=symbol)
             await update.message.reply_text(summary, parse_mode="Markdown")
 
         else:
@@ -186,19 +633,19 @@ async def stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "⚠️ Oh dear! I couldn't find real-time stock data for that symbol using Alpha Vantage. Please double-check the symbol (e.g., `AAPL`, `GOOG`). Keep in mind Alpha Vantage has API limits. 🕰️"
             )
 
-    except requests.exceptions.HTTPError as e:
+    except aiohttp.ClientResponseError as e:
         logger.error(
-            f"HTTP Error fetching Alpha Vantage data for {symbol}: {e} - Response: {response.text}"
+            f"HTTP Error fetching Alpha Vantage data for {symbol}: {e.status} {e.message}"
         )
         await update.message.reply_text(
-            f"⚠️ Alpha Vantage API Error for {symbol}: An HTTP error occurred ({e.response.status_code}). This often happens if the symbol is incorrect, or if you've hit your API call limits (Alpha Vantage has limits for free tier). Please try again after a minute or check the symbol. 🕰️"
+            f"⚠️ Alpha Vantage API Error for {symbol}: An HTTP error occurred ({e.status}). This often happens if the symbol is incorrect, or if you've hit your API call limits (Alpha Vantage has limits for free tier). Please try again after a minute or check the symbol. 🕰️"
         )
-    except requests.exceptions.Timeout:
+    except asyncio.TimeoutError:
         logger.error(f"Timeout fetching Alpha Vantage data for {symbol}.")
         await update.message.reply_text(
             "⚠️ Request timed out while fetching stock data. The Alpha Vantage API might be slow. Please try again. 🐢"
         )
-    except requests.exceptions.RequestException as e:
+    except aiohttp.ClientError as e:
         logger.error(
             f"Network/Request error fetching Alpha Vantage data for {symbol}: {e}",
             exc_info=True)
@@ -207,8 +654,7 @@ async def stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     except json.JSONDecodeError as e:
         logger.error(
-            f"JSON Decode Error for Alpha Vantage response for {symbol}: {e} - Raw response: {response.text}"
-        )
+            f"JSON Decode Error for Alpha Vantage response for {symbol}: {e}")
         await update.message.reply_text(
             "⚠️ I received a malformed response from Alpha Vantage. Please try again later. 🛠️"
         )
@@ -220,12 +666,16 @@ async def stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+def _to_millions(value):
+    """Formats a raw dollar amount as whole millions, e.g. '$1,234M'."""
+    return f"${float(value) / 1e6:,.0f}M"
+
+
 async def analyze(update: Update, context: ContextTypes.DEFAULT_TYPE):
     symbol = " ".join(context.args).upper()
     if not symbol:
         await update.message.reply_text(
-            "❗To get a detailed financial analysis, please tell me the stock symbol. Example: `/analyze IBM`",
-            parse_mode="Markdown")
+            ANALYZE_USAGE, parse_mode="Markdown")
         return
 
     if not ALPHA_VANTAGE_API_KEY:
@@ -239,21 +689,14 @@ async def analyze(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode="Markdown")
 
     try:
-        # Fetch Company Overview for P/E and other ratios
-        overview_url = f"https://www.alphavantage.co/query?function=OVERVIEW&symbol={symbol}&apikey={ALPHA_VANTAGE_API_KEY}"
-        overview_response = requests.get(overview_url, timeout=10).json()
-
-        # Fetch Income Statement (latest annual)
-        income_stmt_url = f"https://www.alphavantage.co/query?function=INCOME_STATEMENT&symbol={symbol}&apikey={ALPHA_VANTAGE_API_KEY}"
-        income_response = requests.get(income_stmt_url, timeout=10).json()
-
-        # Fetch Balance Sheet (latest annual)
-        balance_sheet_url = f"https://www.alphavantage.co/query?function=BALANCE_SHEET&symbol={symbol}&apikey={ALPHA_VANTAGE_API_KEY}"
-        balance_response = requests.get(balance_sheet_url, timeout=10).json()
-
-        # Fetch Cash Flow (latest annual)
-        cash_flow_url = f"https://www.alphavantage.co/query?function=CASH_FLOW&symbol={symbol}&apikey={ALPHA_VANTAGE_API_KEY}"
-        cash_flow_response = requests.get(cash_flow_url, timeout=10).json()
+        # Fetch the Company Overview (P/E and other ratios) and the latest
+        # annual Income Statement, Balance Sheet and Cash Flow concurrently
+        (overview_response, income_response, balance_response,
+         cash_flow_response) = await asyncio.gather(
+             fetch_av(context, "OVERVIEW", symbol),
+             fetch_av(context, "INCOME_STATEMENT", symbol),
+             fetch_av(context, "BALANCE_SHEET", symbol),
+             fetch_av(context, "CASH_FLOW", symbol))
 
         # Check for API call limits or errors from Alpha Vantage
         api_error = False
@@ -282,97 +725,131 @@ async def analyze(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         financial_data_for_ai = {}
-        report_summary = ""
+        parts: list[str] = []
+        # Compact copy of the metrics for the AI prompt (billed per token)
+        prompt_parts: list[str] = []
 
         # Process Overview Data
         if overview_response and not overview_response.get("Error Message"):
             financial_data_for_ai['Overview'] = overview_response
-            report_summary += f"Company Overview:\n"
+            parts.append(f"Company Overview:\n")
             # Use .get() with default values and robust conversion
             description = overview_response.get('Description', 'N/A')
-            report_summary += f"  Description: {description[:200]}{'...' if len(description) > 200 else ''}\n"
-            report_summary += f"  Exchange: {overview_response.get('Exchange', 'N/A')}\n"
-            report_summary += f"  Currency: {overview_response.get('Currency', 'N/A')}\n"
-            report_summary += f"  Sector: {overview_response.get('Sector', 'N/A')}\n"
-            report_summary += f"  Industry: {overview_response.get('Industry', 'N/A')}\n"
+            parts.append(f"  Description: {description[:200]}{'...' if len(description) > 200 else ''}\n")
+            parts.append(f"  Exchange: {overview_response.get('Exchange', 'N/A')}\n")
+            parts.append(f"  Currency: {overview_response.get('Currency', 'N/A')}\n")
+            parts.append(f"  Sector: {overview_response.get('Sector', 'N/A')}\n")
+            parts.append(f"  Industry: {overview_response.get('Industry', 'N/A')}\n")
             # Safely convert and format large numbers
             market_cap = float(overview_response.get('MarketCapitalization',
                                                      0))
-            report_summary += f"  Market Cap: ${int(market_cap):,}\n"
-            report_summary += f"  P/E Ratio: {overview_response.get('PERatio', 'N/A')}\n"
-            report_summary += f"  EPS: {overview_response.get('EPS', 'N/A')}\n"
-            report_summary += f"  Dividend Yield: {float(overview_response.get('DividendYield', 0)):.2f}%\n"  # Ensure float for formatting
-            report_summary += f"  52 Week High: {overview_response.get('52WeekHigh', 'N/A')}\n"
-            report_summary += f"  52 Week Low: {overview_response.get('52WeekLow', 'N/A')}\n\n"
+            parts.append(f"  Market Cap: ${int(market_cap):,}\n")
+            parts.append(f"  P/E Ratio: {overview_response.get('PERatio', 'N/A')}\n")
+            parts.append(f"  EPS: {overview_response.get('EPS', 'N/A')}\n")
+            parts.append(f"  Dividend Yield: {float(overview_response.get('DividendYield', 0)):.2f}%\n")  # Ensure float for formatting
+            parts.append(f"  52 Week High: {overview_response.get('52WeekHigh', 'N/A')}\n")
+            parts.append(f"  52 Week Low: {overview_response.get('52WeekLow', 'N/A')}\n\n")
+            prompt_parts.append(
+                f"Overview: {description[:300]}\n"
+                f"Sector: {overview_response.get('Sector', 'N/A')}; "
+                f"Market Cap: {_to_millions(market_cap)}; "
+                f"P/E: {overview_response.get('PERatio', 'N/A')}; "
+                f"EPS: {overview_response.get('EPS', 'N/A')}; "
+                f"Dividend Yield: {float(overview_response.get('DividendYield', 0)):.2f}%; "
+                f"52W Range: {overview_response.get('52WeekLow', 'N/A')}-{overview_response.get('52WeekHigh', 'N/A')}\n"
+            )
         else:
-            report_summary += "Company Overview data not available.\n\n"
+            parts.append("Company Overview data not available.\n\n")
 
         # Process Income Statement (latest annual)
         if "annualReports" in income_response and income_response[
                 "annualReports"]:
             latest_income = income_response["annualReports"][0]
             financial_data_for_ai['Income Statement'] = latest_income
-            report_summary += "*Income Statement (Latest Annual):*\n"
-            report_summary += f"  Fiscal Date Ending: {latest_income.get('fiscalDateEnding', 'N/A')}\n"
-            report_summary += f"  Total Revenue: ${int(float(latest_income.get('totalRevenue', 0))):,}\n"
-            report_summary += f"  Gross Profit: ${int(float(latest_income.get('grossProfit', 0))):,}\n"
-            report_summary += f"  Operating Income: ${int(float(latest_income.get('operatingIncome', 0))):,}\n"
-            report_summary += f"  Net Income: ${int(float(latest_income.get('netIncome', 0))):,}\n"
-            report_summary += f"  EBITDA: ${int(float(latest_income.get('ebitda', 0))):,}\n\n"
+            parts.append("*Income Statement (Latest Annual):*\n")
+            parts.append(f"  Fiscal Date Ending: {latest_income.get('fiscalDateEnding', 'N/A')}\n")
+            parts.append(f"  Total Revenue: ${int(float(latest_income.get('totalRevenue', 0))):,}\n")
+            parts.append(f"  Gross Profit: ${int(float(latest_income.get('grossProfit', 0))):,}\n")
+            parts.append(f"  Operating Income: ${int(float(latest_income.get('operatingIncome', 0))):,}\n")
+            parts.append(f"  Net Income: ${int(float(latest_income.get('netIncome', 0))):,}\n")
+            parts.append(f"  EBITDA: ${int(float(latest_income.get('ebitda', 0))):,}\n\n")
+            prompt_parts.append(
+                f"Income: Revenue {_to_millions(latest_income.get('totalRevenue', 0))}; "
+                f"Gross Profit {_to_millions(latest_income.get('grossProfit', 0))}; "
+                f"Operating Income {_to_millions(latest_income.get('operatingIncome', 0))}; "
+                f"Net Income {_to_millions(latest_income.get('netIncome', 0))}; "
+                f"EBITDA {_to_millions(latest_income.get('ebitda', 0))}\n")
         else:
-            report_summary += "Income Statement data not available.\n\n"
+            parts.append("Income Statement data not available.\n\n")
 
         # Process Balance Sheet (latest annual)
         if "annualReports" in balance_response and balance_response[
                 "annualReports"]:
             latest_balance = balance_response["annualReports"][0]
             financial_data_for_ai['Balance Sheet'] = latest_balance
-            report_summary += "*Balance Sheet (Latest Annual):*\n"
-            report_summary += f"  Fiscal Date Ending: {latest_balance.get('fiscalDateEnding', 'N/A')}\n"
-            report_summary += f"  Total Assets: ${int(float(latest_balance.get('totalAssets', 0))):,}\n"
-            report_summary += f"  Total Liabilities: ${int(float(latest_balance.get('totalLiabilities', 0))):,}\n"
-            report_summary += f"  Total Shareholder Equity: ${int(float(latest_balance.get('totalShareholderEquity', 0))):,}\n"
-            report_summary += f"  Cash & Equivalents: ${int(float(latest_balance.get('cashAndCashEquivalentsAtCarryingValue', 0))):,}\n\n"
+            parts.append("*Balance Sheet (Latest Annual):*\n")
+            parts.append(f"  Fiscal Date Ending: {latest_balance.get('fiscalDateEnding', 'N/A')}\n")
+            parts.append(f"  Total Assets: ${int(float(latest_balance.get('totalAssets', 0))):,}\n")
+            parts.append(f"  Total Liabilities: ${int(float(latest_balance.get('totalLiabilities', 0))):,}\n")
+            parts.append(f"  Total Shareholder Equity: ${int(float(latest_balance.get('totalShareholderEquity', 0))):,}\n")
+            parts.append(f"  Cash & Equivalents: ${int(float(latest_balance.get('cashAndCashEquivalentsAtCarryingValue', 0))):,}\n\n")
+            prompt_parts.append(
+                f"Balance Sheet: Assets {_to_millions(latest_balance.get('totalAssets', 0))}; "
+                f"Liabilities {_to_millions(latest_balance.get('totalLiabilities', 0))}; "
+                f"Equity {_to_millions(latest_balance.get('totalShareholderEquity', 0))}; "
+                f"Cash {_to_millions(latest_balance.get('cashAndCashEquivalentsAtCarryingValue', 0))}\n"
+            )
         else:
-            report_summary += "Balance Sheet data not available.\n\n"
+            parts.append("Balance Sheet data not available.\n\n")
 
         # Process Cash Flow (latest annual)
         if "annualReports" in cash_flow_response and cash_flow_response[
                 "annualReports"]:
             latest_cash_flow = cash_flow_response["annualReports"][0]
             financial_data_for_ai['Cash Flow Statement'] = latest_cash_flow
-            report_summary += "*Cash Flow Statement (Latest Annual):*\n"
-            report_summary += f"  Fiscal Date Ending: {latest_cash_flow.get('fiscalDateEnding', 'N/A')}\n"
-            report_summary += f"  Operating Cash Flow: ${int(float(latest_cash_flow.get('operatingCashflow', 0))):,}\n"
-            report_summary += f"  Investing Cash Flow: ${int(float(latest_cash_flow.get('cashflowFromInvesting', 0))):,}\n"
-            report_summary += f"  Financing Cash Flow: ${int(float(latest_cash_flow.get('cashflowFromFinancing', 0))):,}\n\n"
+            parts.append("*Cash Flow Statement (Latest Annual):*\n")
+            parts.append(f"  Fiscal Date Ending: {latest_cash_flow.get('fiscalDateEnding', 'N/A')}\n")
+            parts.append(f"  Operating Cash Flow: ${int(float(latest_cash_flow.get('operatingCashflow', 0))):,}\n")
+            parts.append(f"  Investing Cash Flow: ${int(float(latest_cash_flow.get('cashflowFromInvesting', 0))):,}\n")
+            parts.append(f"  Financing Cash Flow: ${int(float(latest_cash_flow.get('cashflowFromFinancing', 0))):,}\n\n")
+            prompt_parts.append(
+                f"Cash Flow: Operating {_to_millions(latest_cash_flow.get('operatingCashflow', 0))}; "
+                f"Investing {_to_millions(latest_cash_flow.get('cashflowFromInvesting', 0))}; "
+                f"Financing {_to_millions(latest_cash_flow.get('cashflowFromFinancing', 0))}\n"
+            )
         else:
-            report_summary += "Cash Flow Statement data not available.\n\n"
+            parts.append("Cash Flow Statement data not available.\n\n")
+
+        report_summary = "".join(parts)
 
         # Use AI to summarize and interpret
         summary_prompt = (
             f"As a friendly and insightful financial AI, summarize the key financial highlights and health of {symbol} "
             f"based on the following raw data. Explain the significance of metrics like P/E ratio, revenue, net income, and cash flow "
             f"in simple terms. Focus on what these numbers *mean* for an average investor. Keep it concise, engaging, and easy to understand.\n\n"
-            f"Raw Financial Data for {symbol}:\n{report_summary}")
-        ai_summary_and_explanation = await generate_ai_response(
-            summary_prompt,
-            max_tokens=700)  # Allow more tokens for detailed summary
-
-        await update.message.reply_text(
-            f"✨ *Financial Deep Dive: {symbol}* ✨\n\n"
-            f"{ai_summary_and_explanation}\n\n"
-            f"---📊 Raw Data Snippets for Your Reference 📊---\n"
+            f"Latest annual figures for {symbol}:\n{''.join(prompt_parts)}"
+        )
+        raw_data_footer = (
+            f"\n\n---📊 Raw Data Snippets for Your Reference 📊---\n"
             f"{report_summary}\n"
-            f"❗ *Disclaimer:* This AI summary is for informational purposes only and is not financial advice. Do your own research! 🧐",
+            f"❗ *Disclaimer:* This AI summary is for informational purposes only and is not financial advice. Do your own research! 🧐"
+        )
+        # Stream the AI summary into the reply as it's generated
+        await reply_with_ai_stream(
+            update.message,
+            summary_prompt,
+            # Allow a longer summary the more statements are available
+            max_tokens=300 + 100 * len(financial_data_for_ai),
+            header=f"✨ *Financial Deep Dive: {symbol}* ✨\n\n",
+            footer=raw_data_footer,
             parse_mode="Markdown")
 
-    except requests.exceptions.Timeout:
+    except asyncio.TimeoutError:
         logger.error(f"Timeout fetching financial data for {symbol}.")
         await update.message.reply_text(
             "⚠️ Request timed out. The financial data API might be slow. Please try again. 🐢"
         )
-    except requests.exceptions.RequestException as e:
+    except aiohttp.ClientError as e:
         logger.error(f"Network/Request error for /analyze {symbol}: {e}",
                      exc_info=True)
         await update.message.reply_text(
@@ -392,8 +869,7 @@ async def news(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     try:
-        url = f"https://newsapi.org/v2/top-headlines?category=business&language=en&apiKey={NEWS_API_KEY}"
-        response = requests.get(url, timeout=10).json()
+        response = await fetch_top_headlines(context)
 
         if response.get("status") == "error":
             logger.error(
@@ -411,23 +887,25 @@ async def news(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
-        news_text = "🗞️ *Top Global Finance News Headlines:*\n\n"
+        news_parts = ["🗞️ *Top Global Finance News Headlines:*\n\n"]
         for i, article in enumerate(articles):
             title = article.get('title', 'No Title')
             source = article.get('source', {}).get('name', 'Unknown Source')
             url = article.get('url', '#')
-            news_text += f"{i+1}. [{title}]({url})\n    _Source: {source}_\n\n"
+            news_parts.append(
+                f"{i+1}. [{title}]({url})\n    _Source: {source}_\n\n")
+        news_text = "".join(news_parts)
 
         await update.message.reply_text(news_text,
                                         parse_mode="Markdown",
                                         disable_web_page_preview=True)
 
-    except requests.exceptions.Timeout:
+    except asyncio.TimeoutError:
         logger.error("Timeout fetching general news.")
         await update.message.reply_text(
             "⚠️ Request timed out while fetching news. The news API might be slow. Please try again. 🐢"
         )
-    except requests.exceptions.RequestException as e:
+    except aiohttp.ClientError as e:
         logger.error(f"Network/Request error for /news: {e}", exc_info=True)
         await update.message.reply_text(
             "⚠️ A network error occurred while fetching news. Please check your internet connection or try again later."
@@ -443,8 +921,7 @@ async def stock_news(update: Update, context: ContextTypes.DEFAULT_TYPE):
     symbol = " ".join(context.args).upper()
     if not symbol:
         await update.message.reply_text(
-            "❗To get news for a specific stock, please provide its symbol. Example: `/stocknews AAPL`",
-            parse_mode="Markdown")
+            STOCKNEWS_USAGE, parse_mode="Markdown")
         return
 
     if not ALPHA_VANTAGE_API_KEY:
@@ -458,11 +935,7 @@ async def stock_news(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode="Markdown")
 
     try:
-        url = (
-            f"https://www.alphavantage.co/query?function=NEWS_SENTIMENT&tickers={symbol}"
-            f"&time_from={(datetime.now() - timedelta(days=7)).strftime('%Y%m%dT%H%M')}&sort=LATEST&limit=10&apikey={ALPHA_VANTAGE_API_KEY}"  # Get more articles for better analysis
-        )
-        response = requests.get(url, timeout=10).json()
+        response = await fetch_av(context, "NEWS_SENTIMENT", symbol)
         articles = response.get("feed", [])
 
         # Check for Alpha Vantage API call limits or errors
@@ -481,23 +954,25 @@ async def stock_news(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode="Markdown")
             return
 
-        news_text = f"📰 *Recent News for {symbol}:*\n\n"
+        news_parts = [f"📰 *Recent News for {symbol}:*\n\n"]
         for i, article in enumerate(articles):
             title = article.get('title', 'No Title')
             url = article.get('url', '#')
             source = article.get('source', 'Unknown Source')
-            news_text += f"{i+1}. [{title}]({url})\n    _Source: {source}_\n\n"
+            news_parts.append(
+                f"{i+1}. [{title}]({url})\n    _Source: {source}_\n\n")
+        news_text = "".join(news_parts)
 
         await update.message.reply_text(news_text,
                                         parse_mode="Markdown",
                                         disable_web_page_preview=True)
 
-    except requests.exceptions.Timeout:
+    except asyncio.TimeoutError:
         logger.error(f"Timeout fetching stock news for {symbol}.")
         await update.message.reply_text(
             "⚠️ Request timed out while fetching stock news. The Alpha Vantage API might be slow. Please try again. 🐢"
         )
-    except requests.exceptions.RequestException as e:
+    except aiohttp.ClientError as e:
         logger.error(f"Network/Request error for /stocknews {symbol}: {e}",
                      exc_info=True)
         await update.message.reply_text(
@@ -514,8 +989,7 @@ async def ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
     question = " ".join(context.args)
     if not question:
         await update.message.reply_text(
-            "❓ What's on your mind? Ask me anything about finance or investments! Example: `/ask What is the difference between stocks and bonds?`",
-            parse_mode="Markdown")
+            ASK_USAGE, parse_mode="Markdown")
         return
 
     await update.message.reply_text(
@@ -524,11 +998,11 @@ async def ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         # Get top news headlines for context
-        news_url = f"https://newsapi.org/v2/top-headlines?category=business&language=en&apiKey={NEWS_API_KEY}"
         news_context = ""
         if NEWS_API_KEY:  # Only try to fetch if API key is present
             try:
-                news_response = requests.get(news_url, timeout=5).json()
+                news_response = await fetch_top_headlines(
+                    context, timeout=aiohttp.ClientTimeout(total=5))
                 if news_response.get("status") == "error":
                     logger.warning(
                         f"NewsAPI error for /ask context: {news_response.get('message', 'Unknown error')}. Proceeding without news context."
@@ -544,12 +1018,12 @@ async def ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         news_context = f"--- Latest Finance Headlines for Context ---\n{headlines}\n"
                     else:
                         news_context = "No recent finance headlines available for context.\n"
-            except requests.exceptions.Timeout:
+            except asyncio.TimeoutError:
                 logger.warning(
                     "Timeout fetching news for /ask context. Proceeding without news context."
                 )
                 news_context = "No recent finance headlines available due to a timeout. Proceeding with general knowledge.\n"
-            except requests.exceptions.RequestException as e:
+            except aiohttp.ClientError as e:
                 logger.warning(
                     f"Network/Request error fetching news for /ask context: {e}. Proceeding without news context."
                 )
@@ -574,10 +1048,8 @@ async def ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"-------------------------------------------\n\n"
             f"User Query: {question}")
 
-        answer = await generate_ai_response(
-            prompt,
-            max_tokens=600)  # Allow more tokens for comprehensive answers
-        await update.message.reply_text(answer)
+        # Allow more tokens for comprehensive answers
+        await reply_with_ai_stream(update.message, prompt, max_tokens=600)
 
     except Exception as e:
         logger.error(f"/ask error: {e}", exc_info=True)
@@ -586,12 +1058,16 @@ async def ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+# Bounds on the news fed into the /recommend prompt (billed per token)
+RECOMMEND_MAX_ARTICLES = 10
+RECOMMEND_SUMMARY_CHARS = 300
+
+
 async def recommend(update: Update, context: ContextTypes.DEFAULT_TYPE):
     symbol = " ".join(context.args).upper()
     if not symbol:
         await update.message.reply_text(
-            "❗To get an AI-driven outlook, please provide a stock symbol. Example: `/recommend TSLA`",
-            parse_mode="Markdown")
+            RECOMMEND_USAGE, parse_mode="Markdown")
         return
 
     if not ALPHA_VANTAGE_API_KEY:
@@ -606,11 +1082,10 @@ async def recommend(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         # Fetch news sentiment from Alpha Vantage
-        sentiment_url = (
-            f"https://www.alphavantage.co/query?function=NEWS_SENTIMENT&tickers={symbol}"
-            f"&time_from={(datetime.now() - timedelta(days=7)).strftime('%Y%m%dT%H%M')}&sort=LATEST&limit=10&apikey={ALPHA_VANTAGE_API_KEY}"  # Get more articles for better analysis
-        )
-        response = requests.get(sentiment_url, timeout=15).json()
+        response = await fetch_av(context,
+                                  "NEWS_SENTIMENT",
+                                  symbol,
+                                  timeout=aiohttp.ClientTimeout(total=15))
         articles = response.get("feed", [])
 
         # Check for Alpha Vantage API call limits or errors
@@ -629,22 +1104,23 @@ async def recommend(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode="Markdown")
             return
 
-        # Prepare news for OpenAI
-        news_summaries = []
-        for i, article in enumerate(articles):
+        # Prepare news for OpenAI, skipping syndicated copies of the same story
+        seen_titles = set()
+        unique_articles = []
+        for article in articles:
             title = article.get('title', 'No Title')
-            summary = article.get('summary', 'No summary available.')
-            overall_sentiment_score = article.get('overall_sentiment_score',
-                                                  'N/A')
-            overall_sentiment_label = article.get('overall_sentiment_label',
-                                                  'N/A')
-
-            news_summaries.append(
-                f"Article {i+1}:\n"
-                f"Title: {title}\n"
-                f"Summary: {summary}\n"
-                f"Overall Sentiment: {overall_sentiment_label} (Score: {overall_sentiment_score})\n"
-            )
+            if title not in seen_titles:
+                seen_titles.add(title)
+                unique_articles.append(article)
+                if len(unique_articles) == RECOMMEND_MAX_ARTICLES:
+                    break
+        news_summaries = [
+            f"Article {i+1}:\n"
+            f"Title: {article.get('title', 'No Title')}\n"
+            f"Summary: {article.get('summary', 'No summary available.')[:RECOMMEND_SUMMARY_CHARS]}\n"
+            f"Overall Sentiment: {article.get('overall_sentiment_label', 'N/A')} (Score: {article.get('overall_sentiment_score', 'N/A')})\n"
+            for i, article in enumerate(unique_articles)
+        ]
 
         news_context = "\n---\n".join(news_summaries)
 
@@ -657,18 +1133,18 @@ async def recommend(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Emphasize the importance of doing personal research and consulting professionals.\n\n"
             f"News Articles for {symbol}:\n{news_context}")
 
-        ai_recommendation = await generate_ai_response(
-            recommendation_prompt,
-            max_tokens=300)  # Keep recommendations concise
-        await update.message.reply_text(ai_recommendation,
-                                        parse_mode="Markdown")
+        # Keep recommendations concise
+        await reply_with_ai_stream(update.message,
+                                   recommendation_prompt,
+                                   max_tokens=300,
+                                   parse_mode="Markdown")
 
-    except requests.exceptions.Timeout:
+    except asyncio.TimeoutError:
         logger.error(f"Timeout fetching news sentiment for {symbol}.")
         await update.message.reply_text(
             "⚠️ Request timed out while fetching news sentiment. The API might be slow. Please try again. 🐢"
         )
-    except requests.exceptions.RequestException as e:
+    except aiohttp.ClientError as e:
         logger.error(f"Network/Request error for /recommend {symbol}: {e}",
                      exc_info=True)
         await update.message.reply_text(
@@ -684,103 +1160,337 @@ async def recommend(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # --- Price Alert Features (using JobQueue) ---
 
 
+# Alpha Vantage accepts up to 100 symbols per bulk quote request
+AV_BATCH_SIZE = 100
+# Quote requests the alert job keeps in flight at once
+AV_MAX_CONCURRENT_REQUESTS = 10
+ALERT_QUOTE_TIMEOUT = aiohttp.ClientTimeout(total=5)
+# Per-symbol GLOBAL_QUOTE lookups one alert check may make without bulk quotes:
+# roughly what the alert budget refills between checks, so nothing piles up
+ALERT_FALLBACK_SYMBOLS_PER_CHECK = ALPHA_VANTAGE_ALERT_CALLS_PER_MINUTE
+# Format: { 'symbol': monotonic time of its last GLOBAL_QUOTE attempt }
+fallback_quote_attempts = TTLCache(maxsize=4096, ttl=24 * 60 * 60)
+
+# Set when Alpha Vantage reports REALTIME_BULK_QUOTES as premium-only for our
+# key; the bulk endpoint is tried again after BULK_QUOTES_RECHECK seconds in
+# case the plan was upgraded
+BULK_QUOTES_RECHECK = 6 * 60 * 60
+bulk_quotes_unavailable_until = 0.0
+
+
+def bulk_quotes_available():
+    """Returns False while the alert job is using per-symbol GLOBAL_QUOTE."""
+    return time.monotonic() >= bulk_quotes_unavailable_until
+
+
+# Alert polling pauses while Alpha Vantage reports rate limits, doubling the
+# pause on each repeated hit and resetting after a clean fetch
+ALERT_BACKOFF_INITIAL = 60
+ALERT_BACKOFF_MAX = 10 * 60
+alert_backoff_delay = 0
+alert_backoff_until = 0.0
+
+
+def alert_backoff_active():
+    """Returns True while alert polling is paused for Alpha Vantage limits."""
+    return time.monotonic() < alert_backoff_until
+
+
+def note_av_rate_limited():
+    """Starts (or extends) the alert polling backoff after a rate limit."""
+    global alert_backoff_delay, alert_backoff_until
+    if alert_backoff_active():  # Already backing off from this round
+        return
+    alert_backoff_delay = min(max(alert_backoff_delay * 2,
+                                  ALERT_BACKOFF_INITIAL), ALERT_BACKOFF_MAX)
+    alert_backoff_until = time.monotonic() + alert_backoff_delay
+    logger.warning(
+        f"Alpha Vantage rate limit hit; pausing alert quote polling for {alert_backoff_delay}s."
+    )
+
+
+class AlertBackoffActive(Exception):
+    """Raised instead of granting an alert quote request during the backoff."""
+
+
+class AlertQuoteRateLimiter(AsyncRateLimiter):
+    """The alert job's share of the Alpha Vantage budget.
+
+    Waiting requests re-check the backoff at least once a second and before
+    taking a token, so when one request hits the limit the queued ones give up
+    promptly without spending tokens.
+    """
+
+    def _check_can_proceed(self):
+        if alert_backoff_active():
+            raise AlertBackoffActive
+
+    async def _wait(self, delay):
+        await asyncio.sleep(min(delay, 1.0))
+
+
+alert_av_rate_limiter = AlertQuoteRateLimiter(
+    ALPHA_VANTAGE_ALERT_CALLS_PER_MINUTE)
+
+
+async def _fetch_bulk_quotes(context: ContextTypes.DEFAULT_TYPE, batch):
+    """Fetches latest prices for up to AV_BATCH_SIZE comma-separated symbols.
+
+    Returns a { 'symbol': price } dict (symbols without a quote are left out),
+    or None if the bulk endpoint isn't available for this API key.
+    """
+    global bulk_quotes_unavailable_until
+    prices = {}
+    av_url = AV_BULK_QUOTES_URL.format(symbols=batch)
+    try:
+        av_data = await fetch_json(context,
+                                   av_url,
+                                   timeout=ALERT_QUOTE_TIMEOUT,
+                                   raise_for_status=True)
+    except (aiohttp.ClientError, asyncio.TimeoutError,
+            json.JSONDecodeError) as e:
+        if isinstance(e, aiohttp.ClientResponseError) and e.status == 429:
+            note_av_rate_limited()
+        logger.warning(
+            f"Failed to get bulk quotes for {batch} from Alpha Vantage during alert check: {e}"
+        )
+        return prices
+
+    if "data" not in av_data:
+        info = av_data.get(
+            "Information", av_data.get("Error Message",
+                                       av_data.get("message", "")))
+        # Only the premium-endpoint notice (or an outright error) means bulk
+        # quotes are off for this key. Rate-limit notices also link to the
+        # premium plans page, so they must not match here.
+        if ("Error Message" in av_data
+                or "premium endpoint" in info.lower()):
+            logger.warning(
+                f"Alpha Vantage bulk quotes are not available for this API key; falling back to GLOBAL_QUOTE. ({info})"
+            )
+            bulk_quotes_unavailable_until = (time.monotonic() +
+                                             BULK_QUOTES_RECHECK)
+            return None
+        # Any other notice is a rate limit: back off and skip this batch.
+        if "Information" in av_data:
+            note_av_rate_limited()
+        logger.warning(f"Alpha Vantage info for {batch}: {info}")
+        return prices
+
+    for quote in av_data["data"]:
+        try:
+            prices[quote["symbol"]] = float(quote["close"])
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(
+                f"Malformed bulk quote from Alpha Vantage: {quote} ({e})")
+    return prices
+
+
+async def _fetch_global_quote_price(context: ContextTypes.DEFAULT_TYPE,
+                                    symbol):
+    """Fetches one symbol's latest price via GLOBAL_QUOTE, or None on failure."""
+    try:
+        av_data = await fetch_av(context,
+                                 "GLOBAL_QUOTE",
+                                 symbol,
+                                 timeout=ALERT_QUOTE_TIMEOUT,
+                                 raise_for_status=True,
+                                 limiter=alert_av_rate_limiter)
+        if "Information" in av_data:
+            note_av_rate_limited()
+        return float(av_data["Global Quote"]["05. price"])
+    except AlertBackoffActive:
+        return None
+    except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError,
+            KeyError, ValueError) as e:
+        if isinstance(e, aiohttp.ClientResponseError) and e.status == 429:
+            note_av_rate_limited()
+        logger.warning(
+            f"Failed to get price for {symbol} from Alpha Vantage during alert check: {e}"
+        )
+        return None
+
+
+async def fetch_batch_prices(context: ContextTypes.DEFAULT_TYPE, symbols):
+    """Fetches latest prices for many symbols, up to 100 per Alpha Vantage request.
+
+    Uses REALTIME_BULK_QUOTES, falling back to one GLOBAL_QUOTE per symbol for
+    API keys without bulk access. The fallback covers at most
+    ALERT_FALLBACK_SYMBOLS_PER_CHECK symbols per call, least recently tried
+    first, so a long watch list is worked through over several checks.
+    """
+    symbols = sorted(symbols)
+    semaphore = asyncio.Semaphore(AV_MAX_CONCURRENT_REQUESTS)
+
+    async def fetch_batch(batch_symbols):
+        if alert_backoff_active():
+            return {}
+        try:
+            async with semaphore, alert_av_rate_limiter:
+                return await _fetch_bulk_quotes(context,
+                                                ",".join(batch_symbols))
+        except AlertBackoffActive:
+            return {}
+
+    async def fetch_single(symbol):
+        async with semaphore:
+            if alert_backoff_active():  # Don't spend quota while limited
+                return symbol, None
+            return symbol, await _fetch_global_quote_price(context, symbol)
+
+    prices = {}
+    fallback_symbols = symbols
+    if bulk_quotes_available():
+        batches = [
+            symbols[i:i + AV_BATCH_SIZE]
+            for i in range(0, len(symbols), AV_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(*(fetch_batch(batch)
+                                         for batch in batches),
+                                       return_exceptions=True)
+        fallback_symbols = []
+        for batch, batch_prices in zip(batches, results):
+            if isinstance(batch_prices, Exception):
+                logger.warning(
+                    f"Unexpected error fetching quotes during alert check: {batch_prices}"
+                )
+            elif batch_prices is None:  # Bulk quotes turned out unavailable
+                fallback_symbols.extend(batch)
+            else:
+                prices.update(batch_prices)
+
+    if fallback_symbols and not alert_backoff_active():
+        # Stable sort: never-tried symbols first, in alphabetical order
+        fallback_symbols = sorted(
+            fallback_symbols,
+            key=lambda symbol: fallback_quote_attempts.get(symbol, 0.0)
+        )[:ALERT_FALLBACK_SYMBOLS_PER_CHECK]
+        now = time.monotonic()
+        for symbol in fallback_symbols:
+            fallback_quote_attempts[symbol] = now
+        results = await asyncio.gather(*(fetch_single(symbol)
+                                         for symbol in fallback_symbols))
+        prices.update(
+            (symbol, price) for symbol, price in results if price is not None)
+    return prices
+
+
+# Comparison against the target price that fires an alert, by direction
+ALERT_CONDITIONS = {'above': operator.ge, 'below': operator.le}
+
+
+def format_price_alert(symbol, alert_data, current_price):
+    """Builds the message for a triggered price alert."""
+    target_price = alert_data.target_price
+    if alert_data.direction == 'above':
+        return (f"🔔 *Price Alert!* 🔔\n\n"
+                f"*{symbol}* has reached or surpassed your target price!\n"
+                f"Current Price: {current_price:.2f}\n"
+                f"Target Price: {target_price:.2f} (above)")
+    return (f"🔔 *Price Alert!* 🔔\n\n"
+            f"*{symbol}* has fallen to or below your target price!\n"
+            f"Current Price: {current_price:.2f}\n"
+            f"Target Price: {target_price:.2f} (below)")
+
+
+# Held while an alert check runs, so a slow cycle never overlaps the next one
+alert_check_lock = asyncio.Lock()
+
+
 # THIS SECTION HAS BEEN MOVED UP TO BE DEFINED BEFORE main()
 async def check_price_alerts(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Callback function to periodically check all active price alerts."""
-    global tracked_stocks
-    logger.info("Checking price alerts...")
-    # Use a copy to allow modification during iteration
-    alerts_to_remove = []
+    if alert_check_lock.locked():
+        logger.warning("Previous price alert check still running; skipping.")
+        return
+    async with alert_check_lock:
+        started = time.monotonic()
+        await run_price_alert_check(context)
+        logger.info(
+            f"Price alert check finished in {time.monotonic() - started:.2f}s."
+        )
 
-    for chat_id_str, symbols_data in list(tracked_stocks.items()):
-        chat_id = int(chat_id_str)  # Convert back to int for send_message
-        for symbol, alert_data in list(symbols_data.items()):
-            target_price = alert_data['target_price']
-            direction = alert_data['direction']
 
-            try:
-                # Fetch current price (using Alpha Vantage Global Quote)
-                current_price = None
-                if ALPHA_VANTAGE_API_KEY:
-                    av_url = f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={ALPHA_VANTAGE_API_KEY}"
-                    try:
-                        response = requests.get(av_url, timeout=5)
-                        response.raise_for_status()
-                        av_data = response.json()
-                        av_global_quote = av_data.get("Global Quote", {})
-                        if av_global_quote and av_global_quote.get(
-                                "05. price"):
-                            current_price = float(av_global_quote["05. price"])
-                        else:
-                            logger.warning(
-                                f"Alpha Vantage did not return price for {symbol} during alert check. Response: {av_data}"
-                            )
-                            # If AV returns info about API limits, handle it.
-                            if "Information" in av_data:
-                                logger.warning(
-                                    f"Alpha Vantage info for {symbol}: {av_data['Information']}"
-                                )
-                                # Optionally, notify user about rate limits if it's the first time
-                                # await context.bot.send_message(chat_id=chat_id, text=f"⚠️ Alpha Vantage API limits hit for {symbol}. Price alerts might be delayed.")
-                                continue  # Skip this symbol for now
-
-                    except (requests.exceptions.RequestException,
-                            json.JSONDecodeError, KeyError) as e:
-                        logger.warning(
-                            f"Failed to get price for {symbol} from Alpha Vantage during alert check: {e}"
-                        )
-                        continue  # Skip to next alert if AV fails
-
-                if current_price is None:
-                    logger.warning(
-                        f"Could not get current price for {symbol} for alert check in chat {chat_id} (API key missing or no data)."
-                    )
-                    continue
-
-                alert_triggered = False
-                message = ""
-
-                if direction == 'above' and current_price >= target_price:
-                    message = (
-                        f"🔔 *Price Alert!* 🔔\n\n"
-                        f"*{symbol}* has reached or surpassed your target price!\n"
-                        f"Current Price: {current_price:.2f}\n"
-                        f"Target Price: {target_price:.2f} (above)")
-                    alert_triggered = True
-                elif direction == 'below' and current_price <= target_price:
-                    message = (
-                        f"🔔 *Price Alert!* 🔔\n\n"
-                        f"*{symbol}* has fallen to or below your target price!\n"
-                        f"Current Price: {current_price:.2f}\n"
-                        f"Target Price: {target_price:.2f} (below)")
-                    alert_triggered = True
-
-                if alert_triggered:
-                    await context.bot.send_message(chat_id=chat_id,
-                                                   text=message,
-                                                   parse_mode="Markdown")
-                    logger.info(
-                        f"Alert triggered for {symbol} at {current_price} for chat {chat_id}."
-                    )
-                    # Mark alert for removal after it's triggered
-                    alerts_to_remove.append((chat_id_str, symbol))
+async def run_price_alert_check(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Checks every active price alert once and sends those that triggered."""
+    global tracked_stocks, alert_backoff_delay
+    logger.info("Checking price alerts...")
+    if not tracked_stocks:
+        return
 
-            except Exception as e:
-                logger.error(
-                    f"Error processing price alert for {symbol} in chat {chat_id}: {e}",
-                    exc_info=True)
+    # Look up every tracked symbol once, however many chats track it
+    prices = {}
+    for symbol in tracked_stocks_by_symbol:
+        price = tracked_stocks_price_cache.get(symbol)
+        if price is not None:
+            prices[symbol] = price
+    missing_symbols = tracked_stocks_by_symbol.keys() - prices.keys()
+    if missing_symbols and ALPHA_VANTAGE_API_KEY:
+        if alert_backoff_active():
+            logger.info(
+                f"Alpha Vantage backoff active; skipping quotes for {len(missing_symbols)} symbol(s) this cycle."
+            )
+        else:
+            fetched_prices = await fetch_batch_prices(context,
+                                                      missing_symbols)
+            tracked_stocks_price_cache.update(fetched_prices)
+            prices.update(fetched_prices)
+            if len(fetched_prices) < len(missing_symbols):
+                logger.info(
+                    f"Got prices for {len(fetched_prices)} of {len(missing_symbols)} uncached symbol(s); the rest are retried next check."
+                )
+            if not alert_backoff_active():  # No rate limit this cycle
+                alert_backoff_delay = 0
+
+    # Check every threshold in one cheap pass, then send only the triggered
+    # alerts, concurrently
+    triggered_alerts = []
+    send_tasks = []
+    for symbol, subscribers in tracked_stocks_by_symbol.items():
+        current_price = prices.get(symbol)
+        if current_price is None:
+            # Expected for part of a long watch list without bulk quotes
+            logger.debug(
+                f"No current price for {symbol} this check (API key missing, rate limited or no data)."
+            )
+            continue
+        for chat_id_str, alert_data in subscribers.items():
+            if ALERT_CONDITIONS[alert_data.direction](
+                    current_price, alert_data.target_price):
+                triggered_alerts.append(
+                    (chat_id_str, symbol, alert_data, current_price))
+                send_tasks.append(
+                    context.bot.send_message(
+                        chat_id=int(chat_id_str),  # Convert back to int
+                        text=format_price_alert(symbol, alert_data,
+                                                current_price),
+                        parse_mode="Markdown"))
+
+    results = await asyncio.gather(*send_tasks, return_exceptions=True)
+    # Mark alerts for removal once their message went out
+    alerts_to_remove = []
+    for (chat_id_str, symbol, alert_data, current_price), result in zip(
+            triggered_alerts, results):
+        if isinstance(result, Exception):
+            logger.error(
+                f"Error sending price alert for {symbol} to chat {chat_id_str}: {result}"
+            )
+            continue
+        logger.info(
+            f"Alert triggered for {symbol} at {current_price} for chat {chat_id_str}."
+        )
+        # Keep an alert the user re-set (or removed) while the sends were out
+        if tracked_stocks.get(chat_id_str, {}).get(symbol) is alert_data:
+            alerts_to_remove.append((chat_id_str, symbol))
 
     # Remove triggered alerts
     for chat_id_str, symbol in alerts_to_remove:
-        if chat_id_str in tracked_stocks and symbol in tracked_stocks[
-                chat_id_str]:
-            del tracked_stocks[chat_id_str][symbol]
-            if not tracked_stocks[chat_id_str]:
-                del tracked_stocks[chat_id_str]
-            save_tracked_stocks(tracked_stocks)
-            logger.info(
-                f"Removed triggered alert for {symbol} from chat {chat_id_str}."
-            )
+        remove_tracked_alert(chat_id_str, symbol)
+        logger.info(
+            f"Removed triggered alert for {symbol} from chat {chat_id_str}.")
+    # Persist all removals from this tick in a single transaction
+    if alerts_to_remove:
+        await run_db_write(delete_alerts, alerts_to_remove)
 
 
 async def track(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -791,8 +1501,7 @@ async def track(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if len(args) != 3:
         await update.message.reply_text(
-            "❗To set a price alert, please use the format: `/track <symbol> <price> <above/below>`\nExample: `/track GOOG 180 above` or `/track AMZN 170 below`",
-            parse_mode="Markdown")
+            TRACK_USAGE, parse_mode="Markdown")
         return
 
     symbol = args[0].upper()
@@ -814,15 +1523,8 @@ async def track(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "❗Invalid direction. Please specify 'above' or 'below'.")
         return
 
-    # Initialize chat_id entry if it doesn't exist
-    if chat_id not in tracked_stocks:
-        tracked_stocks[chat_id] = {}
-
-    tracked_stocks[chat_id][symbol] = {
-        'target_price': target_price,
-        'direction': direction
-    }
-    save_tracked_stocks(tracked_stocks)
+    add_tracked_alert(chat_id, symbol, Alert(target_price, direction))
+    await run_db_write(save_alert, chat_id, symbol, target_price, direction)
 
     await update.message.reply_text(
         f"✅ Great! I'll now alert you when *{symbol}*'s price goes *{direction} {target_price:.2f}*.",
@@ -840,18 +1542,13 @@ async def untrack(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if len(args) != 1:
         await update.message.reply_text(
-            "❗To stop tracking a stock, please use the format: `/untrack <symbol>`\nExample: `/untrack GOOG`",
-            parse_mode="Markdown")
+            UNTRACK_USAGE, parse_mode="Markdown")
         return
 
     symbol = args[0].upper()
 
-    if chat_id in tracked_stocks and symbol in tracked_stocks[chat_id]:
-        del tracked_stocks[chat_id][symbol]
-        if not tracked_stocks[
-                chat_id]:  # If no more alerts for this chat, remove chat entry
-            del tracked_stocks[chat_id]
-        save_tracked_stocks(tracked_stocks)
+    if remove_tracked_alert(chat_id, symbol):
+        await run_db_write(delete_alert, chat_id, symbol)
         await update.message.reply_text(
             f"🗑️ Alright, I've stopped tracking *{symbol}* for you.",
             parse_mode="Markdown")
@@ -868,33 +1565,39 @@ async def my_alerts(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if chat_id not in tracked_stocks or not tracked_stocks[chat_id]:
         await update.message.reply_text(
-            "✨ You currently have no active price alerts. Set one with `/track <symbol> <price> <above/below>`!",
-            parse_mode="Markdown")
+            NO_ALERTS_TEXT, parse_mode="Markdown")
         return
 
-    alerts_text = "🔔 *Your Active Price Alerts:*\n\n"
-    for symbol, alert_data in tracked_stocks[chat_id].items():
-        alerts_text += (
-            f"• *{symbol}*: Alert me when price is *{alert_data['direction']} {alert_data['target_price']:.2f}*\n"
-        )
-    alerts_text += "\nTo remove an alert, use `/untrack <symbol>`."
+    alert_lines = "".join(
+        f"• *{symbol}*: Alert me when price is *{alert_data.direction} {alert_data.target_price:.2f}*\n"
+        for symbol, alert_data in tracked_stocks[chat_id].items())
+    alerts_text = f"{MY_ALERTS_HEADER}{alert_lines}{MY_ALERTS_FOOTER}"
     await update.message.reply_text(alerts_text, parse_mode="Markdown")
 
 
 # --- Main function to run the bot ---
 def main() -> None:
     """Start the bot."""
-    application = Application.builder().token(TELEGRAM_TOKEN).job_queue(
-        JobQueue()).build()
+    application = (
+        Application.builder().token(TELEGRAM_TOKEN).job_queue(JobQueue())
+        # Room for many concurrent send_message calls (e.g. a burst of
+        # alerts), kept apart from the single long-polling getUpdates call
+        .connection_pool_size(64).pool_timeout(10)
+        .get_updates_connection_pool_size(4).get_updates_pool_timeout(30)
+        # Handle updates from different users in parallel
+        .concurrent_updates(True)
+        .post_init(post_init).post_shutdown(post_shutdown).build())
     job_queue = application.job_queue
 
     # --- JOB QUEUE SETUP ---
-    # Schedule the price alert checker to run every 60 seconds
+    # Schedule the price alert checker to run every 60 seconds, with a random
+    # start offset and per-run jitter so instances don't poll in lockstep
     job_queue.run_repeating(
         check_price_alerts,  # This reference is now defined earlier
         interval=60,
-        first=0,
-        name="price_alert_checker")
+        first=random.uniform(0, 30),
+        name="price_alert_checker",
+        job_kwargs={"jitter": 10})
     logger.info("Price alert checker job scheduled.")
     # --- END JOB QUEUE SETUP ---
 
@@ -910,14 +1613,19 @@ def main() -> None:
     application.add_handler(CommandHandler("untrack", untrack))
     application.add_handler(CommandHandler("myalerts", my_alerts))
 
-    # --- KEEP ALIVE ---
-    Thread(target=keep_alive).start()
-    logger.info("Keep-alive thread started.")
-    # --- END KEEP ALIVE ---
-
     # Run the bot until the user presses Ctrl-C
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
-    logger.info("Bot started polling.")
+    if WEBHOOK_HOST:
+        # Telegram pushes updates to us instead of us polling getUpdates
+        logger.info(f"Bot starting webhook on port {PORT}.")
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=PORT,
+            url_path=TELEGRAM_TOKEN,
+            webhook_url=f"https://{WEBHOOK_HOST}/{TELEGRAM_TOKEN}",
+            allowed_updates=Update.ALL_TYPES)
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        logger.info("Bot started polling.")
 
 
 if __name__ == "__main__":